@@ -29,10 +29,22 @@ EXPORT_DIR = PROJECT_ROOT / "exports"          # where raw ChatGPT ZIPs go
 STATIC_SITE_DIR = PROJECT_ROOT / "static_site" # generated HTML
 BACKUP_DIR = PROJECT_ROOT / "backups"          # backup folders
 
+# Local caches (safe to delete; rebuilt automatically)
+CACHE_DIR = Path(
+    os.environ.get(
+        "CHAT_ARCHIVE_CACHE_DIR",
+        Path.home() / ".cache" / "chatgpt_archive",
+    )
+)
+HASH_CACHE_PATH = CACHE_DIR / "hash_cache.json"
+TEMPLATE_CACHE_DIR = CACHE_DIR / "jinja"        # compiled template bytecode (per option set)
+
 # Create directories if missing (safe; does nothing if exists)
 EXPORT_DIR.mkdir(exist_ok=True)
 STATIC_SITE_DIR.mkdir(exist_ok=True)
 BACKUP_DIR.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+TEMPLATE_CACHE_DIR.mkdir(exist_ok=True)
 
 # -------------------------------------------------------------------
 # Environment Variables
@@ -62,6 +74,14 @@ class Config:
     EXPORT_DIR: Path = EXPORT_DIR
     STATIC_SITE_DIR: Path = STATIC_SITE_DIR
     BACKUP_DIR: Path = BACKUP_DIR
+    CACHE_DIR: Path = CACHE_DIR
+
+    # Caches
+    HASH_CACHE_PATH: Path = HASH_CACHE_PATH
+    TEMPLATE_CACHE_DIR: Path = TEMPLATE_CACHE_DIR
+
+    # Hashing ("sha256" or "blake3"; see ingest.hashing)
+    HASH_ALGORITHM: str = os.environ.get("CHAT_ARCHIVE_HASH", "sha256").lower()
 
     # Future options (placeholders)
     DEBUG: bool = False
@@ -2,16 +2,29 @@
 Database connection manager for the ChatGPT Archive ingestion system.
 
 Provides:
-    - get_connection(): Create a new psycopg2 connection
+    - get_connection(): Check out a connection from the shared pool
+    - configure_pool(): Size the pool of a worker process
+    - put_connection(): Return a connection to the pool
     - execute(): Run INSERT/UPDATE/DELETE
-    - fetch_one(), fetch_all(): Read queries
+    - copy_rows(): Bulk-load rows with COPY ... FROM STDIN
+    - execute_prepared(): Run a server-side prepared statement
+    - to_json(): Wrap a value as a JSON/JSONB query parameter
+    - fetch_one(), fetch_all(): Read queries (in READ ONLY transactions)
+    - fetch_iter(): Stream a large result set row by row
     - transaction(): Context manager for safe DB transactions
 
 All settings come from ingest.config.
 """
 
+import io
+import json
+import threading
+import weakref
+
+import orjson
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from contextlib import contextmanager
 
 from ingest.config import config
@@ -21,28 +34,120 @@ logger = get_logger(__name__)
 
 
 # ----------------------------------------------------------------------
-# Connection Factory
+# JSON handling
 # ----------------------------------------------------------------------
+def _json_dumps(obj) -> str:
+    """
+    Serialize obj to JSON text with orjson.
+
+    Everything stored here (normalized chats, message JSON) is decoded
+    JSON, so keys are always strings and the plain encoder path applies;
+    OPT_NON_STR_KEYS makes orjson check every key and is noticeably
+    slower. It is only used as a fallback for dicts with other key types.
+    Integers beyond 64 bits, which orjson rejects, go to the stdlib
+    encoder.
+    """
+    try:
+        return orjson.dumps(obj).decode("utf-8")
+    except orjson.JSONEncodeError:
+        pass
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, ensure_ascii=False)
+
+
+def to_json(obj) -> psycopg2.extras.Json:
+    """
+    Wrap obj for use as a JSON/JSONB query parameter.
+
+    psycopg2 serializes it (with orjson) while building the query, so
+    callers don't need a separate dumps step.
+    """
+    return psycopg2.extras.Json(obj, dumps=_json_dumps)
+
+
+# ----------------------------------------------------------------------
+# Connection Pool
+# ----------------------------------------------------------------------
+# Every query helper below used to open (and close) its own connection,
+# so each INSERT paid a full connect + auth handshake. The pool keeps a
+# few warm connections around instead. It is created on first use so
+# that importing this module never touches the database.
+POOL_MIN_CONNECTIONS = 2
+POOL_MAX_CONNECTIONS = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_size = (POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS)
+
+
+def configure_pool(min_connections: int, max_connections: int) -> None:
+    """
+    Set the size of this process's pool before it is first used.
+
+    Meant for worker processes that only need one or two connections
+    (each process has its own pool, and every connection costs a server
+    backend).
+    """
+    global _pool_size
+
+    with _pool_lock:
+        if _pool is not None:
+            raise RuntimeError(
+                "configure_pool() must be called before the connection "
+                "pool is first used."
+            )
+        _pool_size = (min_connections, max_connections)
+
+
+def _get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Return the process-wide connection pool, creating it if needed."""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    minconn=_pool_size[0],
+                    maxconn=_pool_size[1],
+                    dsn=config.DATABASE_URL,
+                )
+    return _pool
+
+
 def get_connection():
     """
-    Create a new PostgreSQL connection using DATABASE_URL.
+    Check out a PostgreSQL connection from the shared pool.
+
+    Callers must hand it back with put_connection() rather than
+    closing it.
 
     Returns:
         psycopg2 connection object
     """
     try:
-        conn = psycopg2.connect(config.DATABASE_URL)
-        return conn
+        return _get_pool().getconn()
     except Exception as e:
         logger.error(f"Failed to connect to database: {e}")
         raise
 
 
+def put_connection(conn) -> None:
+    """
+    Return a connection to the pool.
+
+    Connections that were closed (e.g. after a dropped socket) are
+    discarded so the pool never hands out a dead connection.
+    """
+    _get_pool().putconn(conn, close=bool(conn.closed))
+
+
 # ----------------------------------------------------------------------
 # Transaction Context Manager
 # ----------------------------------------------------------------------
 @contextmanager
-def transaction():
+def transaction(dict_rows: bool = False, name: str = None, readonly: bool = False):
     """
     Provides a transaction context:
 
@@ -50,42 +155,163 @@ def transaction():
             cur.execute(...)
             cur.execute(...)
 
-    Automatically commits on success or rolls back on failure.
+    Automatically commits on success or rolls back on failure. The
+    underlying connection is borrowed from the pool and returned to it
+    afterwards.
+
+    Rows come back as plain tuples; pass dict_rows=True for a
+    RealDictCursor (one dict per row, keyed by column name).
+
+    With a `name`, the cursor is a server-side (named) cursor: the result
+    set stays on the server and is fetched in batches while iterating.
+
+    readonly=True runs a READ ONLY transaction (the server rejects any
+    write). It costs nothing extra: psycopg2 sends it as part of BEGIN.
     """
 
     conn = get_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    if readonly:
+        conn.readonly = True
+    if dict_rows:
+        cur = conn.cursor(name, cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor(name)
 
     try:
         yield cur
         conn.commit()
     except Exception as e:
-        conn.rollback()
         logger.error(f"Transaction failed: {e}")
+        try:
+            # Roll back and clear session state before the connection
+            # goes back into the pool. reset() runs DISCARD ALL, which
+            # also drops the connection's prepared statements.
+            _prepared.pop(conn, None)
+            conn.reset()
+        except psycopg2.Error:
+            pass  # connection is unusable; put_connection() drops it
         raise
     finally:
-        cur.close()
-        conn.close()
+        # A named cursor is declared WITHOUT HOLD and ends with its
+        # transaction; psycopg2 refuses to close it after that.
+        if name is None:
+            cur.close()
+        if readonly and not conn.closed:
+            # An abandoned fetch_iter() leaves its transaction open, and
+            # the session can only be changed outside of one.
+            conn.rollback()
+            conn.readonly = None  # back to the server default
+        put_connection(conn)
 
 
 # ----------------------------------------------------------------------
 # Query Helpers
 # ----------------------------------------------------------------------
+# Names of the statements already PREPAREd on each pooled connection.
+# Prepared statements live as long as the server session, so this is
+# tracked per connection object; entries vanish with the connection.
+_prepared = weakref.WeakKeyDictionary()
+
+
+def execute_prepared(cur, name: str, statement: str, params: tuple = None):
+    """
+    Execute `statement` as the server-side prepared statement `name`.
+
+    The statement uses PostgreSQL's $1, $2, ... placeholders. It is
+    PREPAREd the first time it runs on a given connection; after that
+    every call is a plain EXECUTE, so the server parses and plans it only
+    once per connection. Results are read from `cur` as usual.
+    """
+    names = _prepared.setdefault(cur.connection, set())
+    if name not in names:
+        cur.execute(f"PREPARE {name} AS {statement}")
+        names.add(name)
+
+    if params:
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
 def execute(query: str, params: tuple = None):
     """Run an INSERT/UPDATE/DELETE query."""
     with transaction() as cur:
         cur.execute(query, params or ())
 
 
-def fetch_one(query: str, params: tuple = None):
-    """Return a single row or None."""
-    with transaction() as cur:
+def fetch_one(query: str, params: tuple = None, dict_rows: bool = True):
+    """Return a single row (a dict, or a tuple if dict_rows=False) or None."""
+    with transaction(dict_rows, readonly=True) as cur:
         cur.execute(query, params or ())
         return cur.fetchone()
 
 
-def fetch_all(query: str, params: tuple = None):
-    """Return all matching rows."""
-    with transaction() as cur:
+def fetch_all(query: str, params: tuple = None, dict_rows: bool = True):
+    """Return all matching rows (dicts, or tuples if dict_rows=False)."""
+    with transaction(dict_rows, readonly=True) as cur:
         cur.execute(query, params or ())
         return cur.fetchall()
+
+
+def fetch_iter(
+    query: str,
+    params: tuple = None,
+    dict_rows: bool = True,
+    itersize: int = 2000,
+):
+    """
+    Yield matching rows one at a time (dicts, or tuples if dict_rows=False).
+
+    Rows are read through a server-side cursor, `itersize` rows per
+    round-trip, so memory use does not grow with the result set. The
+    connection stays checked out until the iterator is exhausted or
+    closed.
+    """
+    with transaction(dict_rows, name="fetch_iter", readonly=True) as cur:
+        cur.itersize = itersize
+        cur.execute(query, params or ())
+        yield from cur
+
+
+def _copy_field(value) -> str:
+    """
+    Encode one value for COPY's text format.
+
+    dicts and lists are written as JSON, for JSON/JSONB columns.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = _json_dumps(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(table: str, columns: tuple, rows: list):
+    """
+    Bulk-load rows into `table` with COPY ... FROM STDIN.
+
+    COPY skips per-row statement parsing entirely and streams all rows
+    in one round-trip. Columns not listed get their default (or NULL).
+    dict/list values are serialized as JSON.
+    `table` and `columns` are trusted identifiers, not user input.
+    """
+    if not rows:
+        return
+
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join([_copy_field(v) for v in row]))
+        buf.write("\n")
+    buf.seek(0)
+
+    with transaction() as cur:
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf
+        )
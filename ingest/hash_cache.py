@@ -0,0 +1,83 @@
+"""
+Sidecar cache of chat hashes for incremental ingestion.
+
+Re-ingesting an export normally re-normalizes and re-hashes every chat,
+even though most of them have not changed since the last run. This
+module remembers, per chat, the export's update_time together with the
+hash computed for it:
+
+    {chat_id: [update_time, chat_hash], ...}
+
+When a chat shows up again with the same update_time and the database
+still holds that hash, the chat can be skipped without normalizing or
+hashing it.
+
+The cache lives outside the database (config.HASH_CACHE_PATH). It is
+purely an optimization: deleting it only makes the next run slower.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ingest.config import config
+from ingest.json_cache import load_json_cache, save_json_cache
+
+# Bump when the hash format changes so stale caches are ignored.
+CACHE_VERSION = 1
+
+HashCache = Dict[str, List[Any]]
+
+
+def cache_key(raw_chat: Dict[str, Any]) -> Optional[Tuple[str, Any]]:
+    """
+    Return (chat_id, update_time) for a raw export chat, or None if the
+    chat lacks either field and therefore cannot be cached.
+    """
+    chat_id = raw_chat.get("id")
+    update_time = raw_chat.get("update_time")
+    if chat_id is None or update_time is None:
+        return None
+    return chat_id, update_time
+
+
+def cached_hash(cache: HashCache, raw_chat: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the cached hash for raw_chat if its update_time still matches.
+    """
+    key = cache_key(raw_chat)
+    if key is None:
+        return None
+
+    entry = cache.get(key[0])
+    if entry is None or entry[0] != key[1]:
+        return None
+    return entry[1]
+
+
+def remember(cache: HashCache, raw_chat: Dict[str, Any], chat_hash: str) -> None:
+    """Record the hash computed for raw_chat."""
+    key = cache_key(raw_chat)
+    if key is not None:
+        cache[key[0]] = [key[1], chat_hash]
+
+
+def _cache_header() -> Dict[str, Any]:
+    return {"version": CACHE_VERSION, "algorithm": config.HASH_ALGORITHM}
+
+
+def load_hash_cache(path: Path = config.HASH_CACHE_PATH) -> HashCache:
+    """
+    Load the cache from disk. A missing, unreadable or outdated cache
+    (including one written for a different hash algorithm) yields an
+    empty one.
+    """
+    return load_json_cache(path, _cache_header(), "hash cache")
+
+
+def save_hash_cache(cache: HashCache, path: Path = config.HASH_CACHE_PATH) -> None:
+    """
+    Write the cache to disk, replacing the old file atomically.
+    """
+    save_json_cache(path, _cache_header(), cache)
@@ -5,6 +5,10 @@ Provides deterministic SHA-256 hashes for:
     - Individual messages
     - Entire chats (title + ordered messages)
 
+Setting CHAT_ARCHIVE_HASH=blake3 switches to BLAKE3 (requires the optional
+`blake3` package). Changing the algorithm changes every hash, so each
+chat is re-ingested once as "updated" on the next run.
+
 These hashes are used to:
     - Detect new vs. existing chats
     - Detect when a chat has changed since last ingestion
@@ -15,62 +19,174 @@ from __future__ import annotations
 
 import hashlib
 import json
-from typing import Any, Dict, Iterable, List, Optional
+from typing import AbstractSet, Any, Dict, Iterable, Optional
+
+import orjson
 
+from ingest.config import config
 from ingest.logger import get_logger
 
 logger = get_logger(__name__)
 
+_ORJSON_CANONICAL = orjson.OPT_SORT_KEYS
+
 
 # --------------------------------------------------------------------
-# Low-level helpers
+# Hash algorithm
 # --------------------------------------------------------------------
 
-def _canonical_json(obj: Any) -> str:
+def _resolve_hash_factory(name: str):
     """
-    Convert a Python object into a canonical JSON string.
-
-    - sort_keys=True ensures deterministic key ordering
-    - separators=(',', ':') removes whitespace differences
-    - ensure_ascii=False preserves Unicode characters
+    Return the constructor of hash objects for the configured algorithm.
 
-    This is important so that logically equivalent structures always
-    hash to the same value.
+    hashlib.sha256 is OpenSSL's implementation, which already uses the
+    CPU's SHA extensions (SHA-NI / ARMv8 crypto) where available.
     """
-    return json.dumps(
-        obj,
-        sort_keys=True,
-        separators=(",", ":"),
-        ensure_ascii=False,
+    if name == "sha256":
+        return hashlib.sha256
+
+    if name == "blake3":
+        try:
+            from blake3 import blake3
+        except ImportError:
+            raise RuntimeError(
+                "CHAT_ARCHIVE_HASH=blake3 requires the 'blake3' package:\n"
+                "pip install blake3"
+            ) from None
+        return blake3
+
+    raise RuntimeError(
+        f"Unsupported CHAT_ARCHIVE_HASH value {name!r}; "
+        "expected 'sha256' or 'blake3'."
     )
 
 
-def _sha256_from_string(text: str) -> str:
+# Factory for new hash objects (all hashing in this module goes through it)
+_HASH = _resolve_hash_factory(config.HASH_ALGORITHM)
+
+
+# --------------------------------------------------------------------
+# Low-level helpers
+# --------------------------------------------------------------------
+
+def _canonical_json(obj: Any) -> bytes:
+    """
+    Convert a Python object into canonical JSON (UTF-8 bytes).
+
+    - OPT_SORT_KEYS ensures deterministic key ordering
+    - output is compact (no whitespace) and keeps Unicode characters
+
+    This is important so that logically equivalent structures always
+    hash to the same value. orjson does the encoding in C; integers
+    beyond 64 bits, which it rejects, fall back to the stdlib encoder.
+    The output matches json.dumps() except for floats with a small
+    negative exponent (orjson writes 0.00001 and 1e-7, json 1e-05 and
+    1e-07).
+
+    Decoded JSON only has string keys, so OPT_NON_STR_KEYS (which makes
+    orjson check every key and is about 2x slower) is only tried as a
+    fallback.
     """
-    Compute SHA-256 hash of a string and return hex digest.
+    try:
+        return orjson.dumps(obj, option=_ORJSON_CANONICAL)
+    except orjson.JSONEncodeError:
+        pass
+    try:
+        return orjson.dumps(
+            obj, option=_ORJSON_CANONICAL | orjson.OPT_NON_STR_KEYS
+        )
+    except orjson.JSONEncodeError:
+        return json.dumps(
+            obj,
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+
+# How many container levels _canonical_hash_update() walks itself before
+# handing whole subtrees to orjson. For a chat payload that is:
+#   payload dict -> "messages" list -> message dict -> (values)
+# so at most one message field is ever materialized at a time.
+_STREAM_DEPTH = 3
+
+
+def _canonical_hash_update(
+    h: Any,
+    obj: Any,
+    depth: int = _STREAM_DEPTH,
+    excluded_keys: AbstractSet[str] = frozenset(),
+) -> None:
     """
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    Feed the canonical JSON encoding of obj into hash object h.
 
+    The bytes fed in are identical to _canonical_json(obj), but the
+    outer `depth` levels of containers are framed piece by piece, so the
+    full document is never materialized at once. Deeper subtrees are
+    encoded in one go by orjson. This keeps hashing memory flat for
+    chats with megabytes of content.
 
-def _sha256_from_bytes(data: bytes) -> str:
+    If obj is a dict, keys in `excluded_keys` are skipped as if they were
+    absent (top level only, like strip_volatile_fields()), without
+    building a filtered copy.
     """
-    Compute SHA-256 hash of bytes and return hex digest.
+    if isinstance(obj, dict) and (depth > 0 or excluded_keys):
+        if not all(isinstance(k, str) for k in obj):
+            # Non-string keys are coerced before sorting; let the
+            # encoder handle this (never seen in exports) case.
+            if excluded_keys:
+                obj = {k: v for k, v in obj.items() if k not in excluded_keys}
+            h.update(_canonical_json(obj))
+            return
+
+        h.update(b"{")
+        first = True
+        for key in sorted(obj):
+            if key in excluded_keys:
+                continue
+            if not first:
+                h.update(b",")
+            first = False
+            h.update(orjson.dumps(key) + b":")
+            _canonical_hash_update(h, obj[key], depth - 1)
+        h.update(b"}")
+
+    elif depth > 0 and isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for i, item in enumerate(obj):
+            if i:
+                h.update(b",")
+            _canonical_hash_update(h, item, depth - 1)
+        h.update(b"]")
+
+    else:
+        h.update(_canonical_json(obj))
+
+
+def _hash_canonical(
+    obj: Any,
+    excluded_keys: AbstractSet[str] = frozenset(),
+) -> str:
     """
-    return hashlib.sha256(data).hexdigest()
+    Compute the hex digest of obj's canonical JSON encoding.
+    """
+    h = _HASH()
+    _canonical_hash_update(h, obj, excluded_keys=excluded_keys)
+    return h.hexdigest()
 
 
 # --------------------------------------------------------------------
 # Message hashing
 # --------------------------------------------------------------------
 
-VOLATILE_MESSAGE_KEYS = {
+VOLATILE_MESSAGE_KEYS = frozenset({
     "id",
     "create_time",
     "update_time",
     "timestamp",
     "rating",
     "metadata",  # often non-essential / auto-generated
-}
+})
 
 
 def strip_volatile_fields(message: Dict[str, Any]) -> Dict[str, Any]:
@@ -96,14 +212,11 @@ def hash_message(raw_message: Dict[str, Any]) -> str:
     Compute a deterministic hash for a single message.
 
     Strategy:
-        - Remove volatile fields
-        - Canonicalize JSON
-        - SHA-256 of canonical representation
-    """
-    cleaned = strip_volatile_fields(raw_message)
-    canonical = _canonical_json(cleaned)
-    digest = _sha256_from_string(canonical)
-    logger.debug(f"Hashed message -> {digest}")
+        - Skip volatile fields (no copy of the message is made)
+        - Stream the canonical JSON representation into the hasher
+    """
+    digest = _hash_canonical(raw_message, VOLATILE_MESSAGE_KEYS)
+    logger.debug("Hashed message -> %s", digest)
     return digest
 
 
@@ -126,7 +239,7 @@ def hash_chat(
                       in the hash (e.g. model name)
 
     Strategy:
-        - Strip volatile fields from each message
+        - Skip volatile fields of each message while encoding
         - Preserve message order
         - Build a canonical structure:
               {
@@ -134,26 +247,39 @@ def hash_chat(
                   "messages": [...],
                   "extra": {...}  # optional
               }
-        - Hash canonical JSON with SHA-256
+        - Stream canonical JSON into the hasher one message at a time
+          (never built as one string)
     """
-    cleaned_messages: List[Dict[str, Any]] = [
-        strip_volatile_fields(m) for m in messages
-    ]
-
-    payload: Dict[str, Any] = {
-        "title": title,
-        "messages": cleaned_messages,
-    }
+    h = _HASH()
 
+    # Keys are emitted in canonical (sorted) order: extra, messages, title
     if extra_fields:
         # Only include deterministic extras
-        payload["extra"] = extra_fields
-
-    canonical = _canonical_json(payload)
-    digest = _sha256_from_string(canonical)
+        h.update(b'{"extra":')
+        h.update(_canonical_json(extra_fields))
+        h.update(b',"messages":[')
+    else:
+        h.update(b'{"messages":[')
+
+    count = 0
+    for count, m in enumerate(messages, 1):
+        if count > 1:
+            h.update(b",")
+
+        # Volatile fields are skipped while encoding, without copying
+        # the message; see strip_volatile_fields() for the semantics.
+        _canonical_hash_update(
+            h, m, depth=1, excluded_keys=VOLATILE_MESSAGE_KEYS
+        )
+
+    h.update(b'],"title":')
+    h.update(_canonical_json(title))
+    h.update(b"}")
+
+    digest = h.hexdigest()
     logger.debug(
         "Hashed chat with %d messages -> %s",
-        len(cleaned_messages),
+        count,
         digest,
     )
     return digest
@@ -0,0 +1,63 @@
+"""
+Versioned JSON files for local caches.
+
+Shared by the ingestion hash cache (ingest.hash_cache) and the static
+site build manifest (static_gen.manifest). Each file holds a few header
+fields, which must match for the file to be used, and its entries:
+
+    {<header fields>, "chats": {...}}
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+import orjson
+
+from ingest.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def load_json_cache(
+    path: Path,
+    header: Dict[str, Any],
+    what: str,
+) -> Dict[str, Any]:
+    """
+    Return the entries stored in `path`. A missing or unreadable file, or
+    one whose header fields differ from `header`, yields an empty dict.
+    `what` names the file in log messages (e.g. "hash cache").
+    """
+    try:
+        data = orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning("Ignoring unreadable %s %s: %s", what, path, e)
+        return {}
+
+    if not isinstance(data, dict) or any(
+        data.get(key) != value for key, value in header.items()
+    ):
+        logger.info("Ignoring outdated %s %s.", what, path)
+        return {}
+
+    return data.get("chats") or {}
+
+
+def save_json_cache(
+    path: Path,
+    header: Dict[str, Any],
+    entries: Dict[str, Any],
+) -> None:
+    """
+    Write `header` and `entries` to `path`, replacing the old file
+    atomically.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(orjson.dumps({**header, "chats": entries}))
+    os.replace(tmp_path, path)
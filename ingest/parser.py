@@ -12,9 +12,12 @@ This module:
 from __future__ import annotations
 
 import json
+import re
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+import orjson
+
 from ingest.logger import logger
 
 
@@ -22,14 +25,30 @@ from ingest.logger import logger
 # Utilities
 # ============================================================================
 
+# orjson parses integers outside the 64-bit range as floats, losing digits.
+# A run of 19+ digits may be such an integer (or just digits in a string);
+# files containing one are parsed with the stdlib instead.
+_LONG_DIGITS = re.compile(rb"\d{19}")
+
+
 def load_conversations_json(path: Path) -> List[Dict[str, Any]]:
     """
     Load ChatGPT's conversations.json export file.
+
+    Parsed with orjson, unless the file may hold an integer orjson would
+    turn into a float (see _LONG_DIGITS), so archived raw JSON keeps
+    every digit.
+
     Returns:
         List of raw chat objects from the export.
     """
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    if _LONG_DIGITS.search(raw):
+        data = json.loads(raw)
+    else:
+        data = orjson.loads(raw)
 
     # Depending on the export version, conversations may be inside "conversations" key.
     if isinstance(data, dict) and "conversations" in data:
@@ -39,7 +58,7 @@ def load_conversations_json(path: Path) -> List[Dict[str, Any]]:
     if isinstance(data, list):
         return data
 
-    logger.warning(f"Unexpected conversations.json structure in {path}")
+    logger.warning("Unexpected conversations.json structure in %s", path)
     return []
 
 
@@ -81,7 +100,7 @@ def extract_message_content(raw_msg: Dict[str, Any]) -> str:
     if isinstance(c, dict):
         parts = c.get("parts")
         if isinstance(parts, list):
-            return "\n".join([p for p in parts if isinstance(p, str)]).strip()
+            return "\n".join(p for p in parts if type(p) is str).strip()
 
         # Format: {"text": "content"}
         if "text" in c and isinstance(c["text"], str):
@@ -98,9 +117,9 @@ def extract_message_content(raw_msg: Dict[str, Any]) -> str:
 # Chat Parsing
 # ============================================================================
 
-def extract_messages_from_chat(raw_chat: Dict[str, Any]) -> List[Dict[str, Any]]:
+def ordered_raw_messages(raw_chat: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Extract a list of normalized messages from a chat.
+    Return the raw message JSON objects of a chat, in message order.
 
     Newer OpenAI export formats use:
         chat["mapping"] = {
@@ -112,60 +131,70 @@ def extract_messages_from_chat(raw_chat: Dict[str, Any]) -> List[Dict[str, Any]]
     We support both gracefully.
     """
 
-    messages: List[Dict[str, Any]] = []
-
     # Chat has a "mapping" dict (2023–2024+ format)
     mapping = raw_chat.get("mapping")
     if isinstance(mapping, dict):
+        # Collect messages and their sort keys in a single pass, so sorting
+        # works off a precomputed key list instead of re-reading
+        # create_time from each message's raw JSON.
+        times: List[float] = []
+        raws: List[Dict[str, Any]] = []
+
         for node in mapping.values():
             msg = node.get("message")
             if not msg:
                 continue
 
-            role = extract_message_role(msg)
-            content = extract_message_content(msg)
-
-            messages.append({
-                "role": role,
-                "content": content,
-                "raw_json": msg     # Preserve full original message JSON
-            })
+            ts = msg.get("create_time")
+            times.append(ts if isinstance(ts, (int, float)) else 0)
+            raws.append(msg)
 
-        # Sort messages by create_time if present, otherwise leave order natural
-        def msg_sort_key(m):
-            ts = m["raw_json"].get("create_time")
-            return ts if isinstance(ts, (int, float)) else 0
-
-        messages.sort(key=msg_sort_key)
-        return messages
+        # Sort messages by create_time if present, otherwise leave order
+        # natural (the sort is stable)
+        order = sorted(range(len(times)), key=times.__getitem__)
+        return [raws[i] for i in order]
 
     # Older exports (rare now)
     # Expect "messages" list directly
     raw_messages = raw_chat.get("messages")
     if isinstance(raw_messages, list):
-        for msg in raw_messages:
-            role = extract_message_role(msg)
-            content = extract_message_content(msg)
+        return raw_messages
 
-            messages.append({
-                "role": role,
-                "content": content,
-                "raw_json": msg
-            })
+    logger.warning(
+        "Chat %s has no recognizable message structure.", raw_chat.get("id")
+    )
+    return []
 
-        return messages
 
-    logger.warning(f"Chat {raw_chat.get('id')} has no recognizable message structure.")
-    return []
+def extract_messages_from_chat(raw_chat: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Extract a list of normalized messages from a chat (see
+    ordered_raw_messages() for the supported formats).
+    """
+    return [
+        {
+            "role": extract_message_role(msg),
+            "content": extract_message_content(msg),
+            "raw_json": msg,    # Preserve full original message JSON
+        }
+        for msg in ordered_raw_messages(raw_chat)
+    ]
 
 
 # ============================================================================
 # Main normalization function
 # ============================================================================
 
-def normalize_chat(raw_chat: Dict[str, Any]) -> Dict[str, Any]:
+def normalize_chat(
+    raw_chat: Dict[str, Any],
+    messages: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
     """
     Normalize a chat from OpenAI's conversations.json.
+
+    `messages` may be the chat's normalized messages, built elsewhere
+    (e.g. in a worker process); otherwise they are extracted here.
+
     Fields returned:
 
         chat_id:       unique chat identifier from export
@@ -185,7 +214,8 @@ def normalize_chat(raw_chat: Dict[str, Any]) -> Dict[str, Any]:
     model = raw_chat.get("model")
 
     # Extract messages (preserves full raw JSON)
-    messages = extract_messages_from_chat(raw_chat)
+    if messages is None:
+        messages = extract_messages_from_chat(raw_chat)
 
     normalized = {
         "chat_id": chat_id,
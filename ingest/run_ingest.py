@@ -3,27 +3,46 @@ Main ingestion pipeline for the ChatGPT Archive system.
 
 Steps:
     1. Load conversations.json from a ChatGPT export directory
-    2. Normalize each chat
-    3. Compute chat hash
-    4. Check database for existing chat
-    5. Insert new chats OR update changed chats
-    6. Insert ordered messages
-    7. Print summary
+    2. Normalize each chat            (in parallel worker processes)
+    3. Compute chat hash              (in parallel worker processes)
+    4. Upsert chat (insert new chats OR update changed chats)
+    5. Insert ordered messages
+    6. Print summary
+
+Chats that are known to be unchanged since the previous run (see
+ingest.hash_cache) skip steps 2-5.
 
 This module orchestrates the entire ingestion workflow.
 """
 
 from __future__ import annotations
 
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 from ingest.logger import logger
 from ingest.config import config
-from ingest.db import fetch_one, fetch_all, execute
-from ingest.parser import load_conversations_json, normalize_chat
+from ingest.db import (
+    transaction,
+    fetch_all,
+    copy_rows,
+    execute_prepared,
+    to_json,
+)
+from ingest.parser import (
+    load_conversations_json,
+    normalize_chat,
+    ordered_raw_messages,
+)
 from ingest.hashing import hash_chat
+from ingest.hash_cache import (
+    HashCache,
+    cached_hash,
+    load_hash_cache,
+    remember,
+    save_hash_cache,
+)
 
 
 # ============================================================================
@@ -34,13 +53,12 @@ def flatten_content(messages: List[Dict[str, Any]]) -> str:
     """
     Combine all text messages into a single searchable/browsable string.
     """
-    parts = []
-    for msg in messages:
-        text = msg.get("content") or ""
-        if isinstance(text, str) and text.strip():
-            parts.append(text.strip())
-
-    return "\n".join(parts).strip()
+    stripped = (
+        text.strip()
+        for text in (msg.get("content") for msg in messages)
+        if isinstance(text, str)
+    )
+    return "\n".join(t for t in stripped if t)
 
 
 # ============================================================================
@@ -69,45 +87,71 @@ def find_conversations_json(export_dir: Path) -> Path:
 # Database Insert/Update Helpers
 # ============================================================================
 
-def upsert_chat(normalized: Dict[str, Any], chat_hash: str) -> int:
+# Prepared once per pooled connection (see ingest.db.execute_prepared).
+# `prev` is evaluated against the snapshot taken before the INSERT, so it
+# still holds the previous hash (or nothing) after the row is written.
+UPSERT_CHAT_SQL = """
+    WITH prev AS (
+        SELECT id, hash
+        FROM chats
+        WHERE chat_id = $1
+    ),
+    upserted AS (
+        INSERT INTO chats (
+            chat_id, title,
+            create_time, update_time,
+            model, hash,
+            content_text, raw_json
+        )
+        VALUES (
+            $1, $2,
+            to_timestamp($3), to_timestamp($4),
+            $5, $6,
+            $7, $8
+        )
+        ON CONFLICT (chat_id) DO UPDATE
+        SET title = EXCLUDED.title,
+            create_time = EXCLUDED.create_time,
+            update_time = EXCLUDED.update_time,
+            model = EXCLUDED.model,
+            hash = EXCLUDED.hash,
+            content_text = EXCLUDED.content_text,
+            raw_json = EXCLUDED.raw_json
+        WHERE chats.hash <> EXCLUDED.hash
+        RETURNING id
+    )
+    SELECT
+        COALESCE((SELECT id FROM upserted), (SELECT id FROM prev)) AS id,
+        (SELECT hash FROM prev) AS prev_hash
+"""
+
+
+def upsert_chat(normalized: Dict[str, Any], chat_hash: str) -> Tuple[int, str]:
     """
     Insert a new chat or update an existing one.
+
+    A single INSERT ... ON CONFLICT statement both writes the row and
+    reports the hash stored before the write, so change detection costs
+    one round-trip per chat. The statement is server-side prepared, so it
+    is planned once per connection rather than once per chat. Rows whose
+    hash is unchanged are left alone.
+    When a chat is updated its old messages are deleted in the same
+    transaction (they will be reinserted).
+
     Returns:
-        chat_id (database id)
+        (chat_id (database id), status) where status is one of
+        "new", "updated" or "unchanged"
     """
 
-    # Try to find existing chat by chat_id from export
-    existing = fetch_one(
-        "SELECT id, hash FROM chats WHERE chat_id = %s",
-        (normalized["chat_id"],),
-    )
-
-    # Prepare flattened content and raw JSON to store
+    # Prepare flattened content to store (raw JSON is serialized by the
+    # to_json() adapter)
     content_text = flatten_content(normalized["messages"])
-    raw_json_text = json.dumps(normalized, ensure_ascii=False)
-
-    # ----------------------------------------------------------------------
-    # INSERT NEW CHAT
-    # ----------------------------------------------------------------------
-    if existing is None:
-        logger.info(f"Inserting new chat: {normalized['title'][:60]}")
-
-        result = fetch_one(
-            """
-            INSERT INTO chats (
-                chat_id, title,
-                create_time, update_time,
-                model, hash,
-                content_text, raw_json
-            )
-            VALUES (
-                %s, %s,
-                to_timestamp(%s), to_timestamp(%s),
-                %s, %s,
-                %s, %s
-            )
-            RETURNING id
-            """,
+
+    with transaction() as cur:
+        execute_prepared(
+            cur,
+            "upsert_chat",
+            UPSERT_CHAT_SQL,
             (
                 normalized["chat_id"],
                 normalized["title"],
@@ -116,87 +160,200 @@ def upsert_chat(normalized: Dict[str, Any], chat_hash: str) -> int:
                 normalized["model"],
                 chat_hash,
                 content_text,
-                raw_json_text,
+                to_json(normalized),
             ),
         )
+        chat_db_id, prev_hash = cur.fetchone()
+
+        # ------------------------------------------------------------------
+        # NEW CHAT
+        # ------------------------------------------------------------------
+        if prev_hash is None:
+            logger.info("Inserting new chat: %s", normalized["title"][:60])
+            return chat_db_id, "new"
+
+        # ------------------------------------------------------------------
+        # EXISTING CHAT (updated only if hash changed)
+        # ------------------------------------------------------------------
+        if prev_hash == chat_hash:
+            logger.info("No changes: %s", normalized["title"][:60])
+            return chat_db_id, "unchanged"
+
+        logger.info("Updating modified chat: %s", normalized["title"][:60])
+
+        # Remove old messages (they will be reinserted)
+        cur.execute("DELETE FROM messages WHERE chat_id = %s", (chat_db_id,))
+
+    return chat_db_id, "updated"
+
 
-        return result["id"]
-
-    # ----------------------------------------------------------------------
-    # UPDATE EXISTING CHAT (if hash changed)
-    # ----------------------------------------------------------------------
-    existing_hash = existing["hash"]
-
-    if existing_hash == chat_hash:
-        logger.info(f"No changes: {normalized['title'][:60]}")
-        return existing["id"]
-
-    logger.info(f"Updating modified chat: {normalized['title'][:60]}")
-
-    chat_db_id = existing["id"]
-
-    # Update chat row
-    execute(
-        """
-        UPDATE chats
-        SET title = %s,
-            create_time = to_timestamp(%s),
-            update_time = to_timestamp(%s),
-            model = %s,
-            hash = %s,
-            content_text = %s,
-            raw_json = %s
-        WHERE id = %s
-        """,
+def insert_messages(chat_db_id: int, messages: List[Dict[str, Any]]):
+    """
+    Insert a list of messages for a chat_id, preserving message_index.
+
+    All rows are streamed in a single COPY, one round-trip per chat no
+    matter how many messages it has. created_at is left NULL.
+    """
+    rows = [
         (
-            normalized["title"],
-            normalized["create_time"] or 0,
-            normalized["update_time"] or 0,
-            normalized["model"],
-            chat_hash,
-            content_text,
-            raw_json_text,
             chat_db_id,
-        ),
+            index,
+            msg["role"],
+            msg["content"],
+            msg["raw_json"],    # serialized to JSON by copy_rows()
+        )
+        for index, msg in enumerate(messages)
+    ]
+
+    copy_rows(
+        "messages",
+        ("chat_id", "message_index", "role", "content", "raw_json"),
+        rows,
     )
 
-    # Remove old messages (they will be reinserted)
-    execute("DELETE FROM messages WHERE chat_id = %s", (chat_db_id,))
 
-    return chat_db_id
+# ============================================================================
+# Preprocessing (CPU-bound, no database access)
+# ============================================================================
 
+# Chats handed to each worker process per task; amortizes IPC overhead.
+PREPROCESS_CHUNKSIZE = 32
 
-def insert_messages(chat_db_id: int, messages: List[Dict[str, Any]]):
+
+def preprocess_chat(raw_chat: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
     """
-    Insert a list of messages for a chat_id, preserving message_index.
+    Normalize a raw chat and compute its change-detection hash.
+
+    This is pure CPU work with no database contact, so it can run in
+    worker processes.
+
+    Returns:
+        (normalized chat, chat hash)
     """
-    for index, msg in enumerate(messages):
-        execute(
-            """
-            INSERT INTO messages (
-                chat_id, message_index,
-                role, created_at, content, raw_json
-            )
-            VALUES (%s, %s, %s, NULL, %s, %s)
-            """,
-            (
-                chat_db_id,
-                index,
-                msg["role"],
-                msg["content"],
-                json.dumps(msg["raw_json"], ensure_ascii=False),
-            ),
+    normalized = normalize_chat(raw_chat)
+
+    chat_hash = hash_chat(
+        title=normalized["title"],
+        messages=normalized["messages"],
+        extra_fields={"model": normalized["model"]},
+    )
+
+    return normalized, chat_hash
+
+
+def _preprocess_in_worker(
+    raw_chat: Dict[str, Any],
+) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    preprocess_chat() for a worker process.
+
+    Only each message's (role, content) and the chat hash are sent back;
+    the raw JSON (the bulk of a chat) is re-attached by the parent from
+    its own copy of the export, see preprocess_chats().
+    """
+    normalized, chat_hash = preprocess_chat(raw_chat)
+    fields = [(msg["role"], msg["content"]) for msg in normalized["messages"]]
+    return fields, chat_hash
+
+
+def preprocess_chats(
+    raw_chats: List[Dict[str, Any]],
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """
+    Yield preprocess_chat() results for every raw chat, in export order.
+
+    Work is spread over a process pool (`workers` processes, default:
+    one per CPU); workers <= 1 runs everything in this process. Results
+    are yielded as they complete, so the caller's database work overlaps
+    with preprocessing of later chats.
+
+    Workers never touch the database; any pooled connections they
+    inherit from the parent are left alone. They return no raw JSON:
+    the normalized chat is rebuilt here around the parent's raw chat, so
+    neither a pickled copy of it nor a second copy in memory is needed.
+    """
+    if workers is not None and workers <= 1:
+        yield from map(preprocess_chat, raw_chats)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _preprocess_in_worker, raw_chats, chunksize=PREPROCESS_CHUNKSIZE
         )
+        for raw_chat, (fields, chat_hash) in zip(raw_chats, results):
+            messages = [
+                {"role": role, "content": content, "raw_json": raw_msg}
+                for (role, content), raw_msg in zip(
+                    fields, ordered_raw_messages(raw_chat)
+                )
+            ]
+            yield normalize_chat(raw_chat, messages), chat_hash
+
+
+# ============================================================================
+# Incremental ingestion: skip chats known to be unchanged
+# ============================================================================
+
+def fetch_existing_hashes(
+    raw_chats: List[Dict[str, Any]],
+) -> Dict[str, Tuple[int, str]]:
+    """
+    Look up every chat of the export that is already in the database,
+    with a single query.
+
+    Returns:
+        {chat_id (export id): (database id, stored hash)}
+    """
+    chat_ids = [rc["id"] for rc in raw_chats if rc.get("id") is not None]
+    if not chat_ids:
+        return {}
+
+    rows = fetch_all(
+        "SELECT chat_id, id, hash FROM chats WHERE chat_id = ANY(%s)",
+        (chat_ids,),
+        dict_rows=False,
+    )
+    return {chat_id: (db_id, chat_hash) for chat_id, db_id, chat_hash in rows}
+
+
+def skip_cached_chats(
+    raw_chats: List[Dict[str, Any]],
+    hash_cache: HashCache,
+    existing: Dict[str, Tuple[int, str]],
+) -> List[Dict[str, Any]]:
+    """
+    Return the raw chats that still need to be normalized and hashed.
+
+    A chat is skipped when the hash cache has an entry for its
+    (chat_id, update_time) and the database (`existing`, see
+    fetch_existing_hashes()) holds that same hash.
+    """
+    to_process = []
+    for raw_chat in raw_chats:
+        chat_hash = cached_hash(hash_cache, raw_chat)
+        stored = existing.get(raw_chat.get("id"))
+        if chat_hash is None or stored is None or stored[1] != chat_hash:
+            to_process.append(raw_chat)
+
+    skipped = len(raw_chats) - len(to_process)
+    if skipped:
+        logger.info("Skipping %d chats unchanged since last run.", skipped)
+
+    return to_process
 
 
 # ============================================================================
 # Main Ingestion Pipeline
 # ============================================================================
 
-def ingest_export(export_path: Path):
+def ingest_export(export_path: Path, workers: Optional[int] = None):
     """
     Given a path to a ChatGPT export directory,
     run the full ingestion pipeline.
+
+    `workers` sets the number of processes used to normalize and hash
+    chats (default: one per CPU).
     """
 
     logger.info(f"Starting ingestion from: {export_path}")
@@ -210,34 +367,38 @@ def ingest_export(export_path: Path):
     updated_count = 0
     unchanged_count = 0
 
-    for raw_chat in raw_chats:
-        normalized = normalize_chat(raw_chat)
-        messages = normalized["messages"]
-
-        # Hash for change detection
-        chat_hash = hash_chat(
-            title=normalized["title"],
-            messages=messages,
-            extra_fields={"model": normalized["model"]},
-        )
-
-        old_row = fetch_one(
-            "SELECT id, hash FROM chats WHERE chat_id = %s",
-            (normalized["chat_id"],)
-        )
+    # Skip chats whose export update_time matches the hash cache and
+    # whose cached hash is still the one stored in the database.
+    existing = fetch_existing_hashes(raw_chats)
+    hash_cache = load_hash_cache()
+    to_process = skip_cached_chats(raw_chats, hash_cache, existing)
+    unchanged_count += len(raw_chats) - len(to_process)
+
+    results = preprocess_chats(to_process, workers)
+    for raw_chat, (normalized, chat_hash) in zip(to_process, results):
+        remember(hash_cache, raw_chat, chat_hash)
+
+        # Unchanged chats are recognized without another round-trip
+        stored = existing.get(normalized["chat_id"])
+        if stored is not None and stored[1] == chat_hash:
+            logger.info("No changes: %s", normalized["title"][:60])
+            unchanged_count += 1
+            continue
 
-        chat_db_id = upsert_chat(normalized, chat_hash)
+        chat_db_id, status = upsert_chat(normalized, chat_hash)
 
-        if old_row is None:
+        if status == "new":
             new_count += 1
-        elif old_row["hash"] != chat_hash:
+        elif status == "updated":
             updated_count += 1
         else:
             unchanged_count += 1
             continue
 
         # Insert messages (unless chat was unchanged)
-        insert_messages(chat_db_id, messages)
+        insert_messages(chat_db_id, normalized["messages"])
+
+    save_hash_cache(hash_cache)
 
     logger.info("Ingestion complete.")
     logger.info(f"New chats: {new_count}")
@@ -258,6 +419,12 @@ if __name__ == "__main__":
         type=str,
         help="Path to the directory containing conversations.json."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to normalize and hash chats (default: CPU count)."
+    )
 
     args = parser.parse_args()
-    ingest_export(Path(args.export_dir).resolve())
+    ingest_export(Path(args.export_dir).resolve(), workers=args.workers)
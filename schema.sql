@@ -43,7 +43,7 @@ CREATE TABLE IF NOT EXISTS chats (
     source_file     TEXT,                           -- name of JSON source file
 
     -- Content & change detection
-    hash            TEXT NOT NULL,                  -- SHA256 checksum
+    hash            TEXT NOT NULL,                  -- SHA256 (or BLAKE3) checksum
     content_text    TEXT NOT NULL,                  -- flattened conversation text
     summary         TEXT,                           -- optional short summary
 
@@ -4,39 +4,28 @@ Render individual chat pages as static HTML.
 
 from __future__ import annotations
 
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from html import escape
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-
-from ingest.db import fetch_one, fetch_all
+from ingest.db import configure_pool, fetch_one, fetch_all
 from ingest.logger import logger
 
-
-# -----------------------------------------------------------------------------
-# Jinja2 environment
-# -----------------------------------------------------------------------------
-
-TEMPLATES_DIR = Path(__file__).resolve().parent / "templates"
-
-
-def get_env() -> Environment:
-    env = Environment(
-        loader=FileSystemLoader(str(TEMPLATES_DIR)),
-        autoescape=select_autoescape(["html", "xml"]),
-    )
-    return env
+from static_gen.manifest import Manifest
+from static_gen.page_writer import PageWriter, gzip_sibling, write_page
+from static_gen.templating import get_template
 
 
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
 
-def ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
-
-
 def nl2br(text: str) -> str:
     """
     Simple newline-to-<br> conversion for plain text messages.
@@ -44,50 +33,38 @@ def nl2br(text: str) -> str:
     """
     if not text:
         return ""
-    # Escape basic HTML special chars, then replace newlines
-    escaped = (
-        text.replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-    )
-    return escaped.replace("\n", "<br>\n")
+    # Escape basic HTML special chars (&, <, >), then replace newlines
+    return escape(text, quote=False).replace("\n", "<br>\n")
 
 
 # -----------------------------------------------------------------------------
-# Core render function
+# Core render functions
 # -----------------------------------------------------------------------------
 
-def render_chat_page(output_root: Path, chat_db_id: int) -> Path:
-    """
-    Render a single chat (by DB id) to static_site/chat/<chat_id>.html.
+CHAT_COLUMNS = "id, chat_id, title, create_time, update_time, model"
 
-    Returns the path to the generated file.
-    """
-    # 1) Fetch chat row
-    chat_row = fetch_one(
-        """
-        SELECT id, chat_id, title, create_time, update_time, model
-        FROM chats
-        WHERE id = %s
-        """,
-        (chat_db_id,),
-    )
 
-    if chat_row is None:
-        raise ValueError(f"Chat id {chat_db_id} not found in database.")
+def chat_page_path(output_root: Path, chat_id: str) -> Path:
+    """Return the path of a chat's page: static_site/chat/<chat_id>.html"""
+    return output_root / "chat" / f"{chat_id}.html"
 
-    # 2) Fetch messages for this chat
-    msg_rows = fetch_all(
-        """
-        SELECT message_index, role, content
-        FROM messages
-        WHERE chat_id = %s
-        ORDER BY message_index
-        """,
-        (chat_db_id,),
-    )
 
-    # 3) Prepare data for template
+def _write_chat_page(
+    output_root: Path,
+    chat_row: Dict[str, Any],
+    msg_rows: List[Dict[str, Any]],
+    writer: Optional[PageWriter] = None,
+    compress: bool = True,
+) -> Path:
+    """
+    Render one chat from already-fetched rows and write it to
+    static_site/chat/<chat_id>.html. That directory must already exist.
+
+    With a `writer`, the file is written by its background thread and may
+    not exist yet when this returns. Otherwise it is written here, along
+    with a gzip copy if `compress` (see page_writer.write_page()).
+    """
+    # 1) Prepare data for template
     messages: List[Dict[str, Any]] = []
     for m in msg_rows:
         messages.append(
@@ -106,9 +83,8 @@ def render_chat_page(output_root: Path, chat_db_id: int) -> Path:
         "model": chat_row["model"],
     }
 
-    # 4) Jinja render
-    env = get_env()
-    template = env.get_template("chat.html")
+    # 2) Jinja render
+    template = get_template("chat.html")
 
     html = template.render(
         title=chat["title"],
@@ -117,14 +93,253 @@ def render_chat_page(output_root: Path, chat_db_id: int) -> Path:
         css_prefix="../",  # because chat pages live in /chat/
     )
 
-    # 5) Write to static_site/chat/<chat_id>.html
-    chat_dir = output_root / "chat"
-    ensure_dir(chat_dir)
+    # 3) Write to static_site/chat/<chat_id>.html
+    out_path = chat_page_path(output_root, chat["chat_id"])
 
-    filename = f"{chat['chat_id']}.html"
-    out_path = chat_dir / filename
-
-    out_path.write_text(html, encoding="utf-8")
-    logger.info(f"Rendered chat {chat['chat_id']} → {out_path}")
+    if writer is not None:
+        writer.write(out_path, html)
+    else:
+        write_page(out_path, html, compress)
+    logger.debug("Rendered chat %s → %s", chat["chat_id"], out_path)
 
     return out_path
+
+
+def render_chat_page(
+    output_root: Path,
+    chat_db_id: int,
+    messages: Optional[List[Dict[str, Any]]] = None,
+    compress: bool = True,
+) -> Path:
+    """
+    Render a single chat (by DB id) to static_site/chat/<chat_id>.html
+    (and chat/<chat_id>.html.gz, unless compress=False).
+
+    `messages` may be that chat's message rows, already fetched by the
+    caller (e.g. from one bulk query over all chats), ordered by
+    message_index; otherwise they are queried here.
+
+    output_root/chat must already exist (see
+    generator.prepare_output_dir()).
+
+    Returns the path to the generated file.
+    """
+    # 1) Fetch chat row
+    chat_row = fetch_one(
+        f"""
+        SELECT {CHAT_COLUMNS}
+        FROM chats
+        WHERE id = %s
+        """,
+        (chat_db_id,),
+    )
+
+    if chat_row is None:
+        raise ValueError(f"Chat id {chat_db_id} not found in database.")
+
+    # 2) Fetch messages for this chat, unless the caller already has them
+    if messages is None:
+        messages = fetch_all(
+            """
+            SELECT message_index, role, content
+            FROM messages
+            WHERE chat_id = %s
+            ORDER BY message_index
+            """,
+            (chat_db_id,),
+        )
+
+    return _write_chat_page(output_root, chat_row, messages, compress=compress)
+
+
+# Chats rendered per worker task; each task costs two queries.
+RENDER_BATCH_SIZE = 64
+
+# Database connections each render worker process may open: it runs a
+# batch's two queries at the same time. Only one is opened up front.
+WORKER_POOL_CONNECTIONS = 2
+
+# Upper bound on connections held by all render workers together, well
+# below PostgreSQL's default max_connections (100); it caps the number of
+# workers on machines with many cores.
+MAX_RENDER_CONNECTIONS = 32
+
+
+def render_chat_batch(
+    output_root: Path,
+    chat_db_ids: List[int],
+    compress: bool = True,
+) -> List[Path]:
+    """
+    Render a batch of chats (by DB id), fetching all of their rows with
+    two queries. Pages get gzip copies unless compress=False.
+
+    This is the unit of work handed to worker processes by
+    render_all_chats(); each worker uses its own connection pool. The
+    two queries run concurrently, on two pooled connections.
+
+    Returns the paths of the generated files.
+    """
+    # 1) Fetch the batch's messages on a helper thread while its chats
+    #    are fetched here
+    with ThreadPoolExecutor(max_workers=1) as fetcher:
+        msgs_future = fetcher.submit(
+            fetch_all,
+            """
+            SELECT chat_id, message_index, role, content
+            FROM messages
+            WHERE chat_id = ANY(%s)
+            ORDER BY chat_id, message_index
+            """,
+            (chat_db_ids,),
+        )
+        chat_rows = fetch_all(
+            f"""
+            SELECT {CHAT_COLUMNS}
+            FROM chats
+            WHERE id = ANY(%s)
+            ORDER BY create_time NULLS LAST, id
+            """,
+            (chat_db_ids,),
+        )
+        msg_rows = msgs_future.result()
+
+    # 2) Group messages by chat (rows arrive sorted by chat_id)
+    msgs_by_chat: Dict[int, List[Dict[str, Any]]] = {
+        chat_db_id: list(rows)
+        for chat_db_id, rows in groupby(msg_rows, key=itemgetter("chat_id"))
+    }
+
+    # 3) Render each chat from memory; pages are written in the
+    #    background while the next ones render
+    with PageWriter(compress=compress) as writer:
+        return [
+            _write_chat_page(
+                output_root,
+                chat_row,
+                msgs_by_chat.get(chat_row["id"], []),
+                writer,
+            )
+            for chat_row in chat_rows
+        ]
+
+
+def _page_complete(page_path: Path, compress: bool) -> bool:
+    """Whether a page (and its gzip copy, if wanted) is on disk."""
+    if not page_path.exists():
+        return False
+    return not compress or gzip_sibling(page_path).exists()
+
+
+def remove_deleted_pages(
+    output_root: Path,
+    manifest: Manifest,
+    chat_ids: Set[str],
+) -> None:
+    """
+    Delete the pages of chats in the manifest that are no longer in
+    `chat_ids` (the chats in the database), and forget them.
+    """
+    for chat_id in [c for c in manifest if c not in chat_ids]:
+        logger.info("Removing page of deleted chat %s", chat_id)
+        page_path = chat_page_path(output_root, chat_id)
+        page_path.unlink(missing_ok=True)
+        gzip_sibling(page_path).unlink(missing_ok=True)
+        del manifest[chat_id]
+
+
+def render_all_chats(
+    output_root: Path,
+    workers: Optional[int] = None,
+    manifest: Optional[Manifest] = None,
+    compress: bool = True,
+) -> List[Path]:
+    """
+    Render every chat in the database to static_site/chat/.
+
+    Chats are split into batches of RENDER_BATCH_SIZE and rendered by a
+    process pool (`workers` processes, default: one per CPU); workers=1
+    renders everything in this process. Pages are independent, so this
+    scales with the number of cores.
+
+    Workers are started with the "spawn" method: a forked child would
+    inherit this process's pooled database connections, and closing them
+    there would also close them for the parent. Each worker opens a pool
+    of its own, of up to WORKER_POOL_CONNECTIONS connections, and there
+    are never more workers than MAX_RENDER_CONNECTIONS allows (or than
+    batches to render).
+
+    With a `manifest` from a previous build (see static_gen.manifest),
+    only chats whose hash changed (or whose page is missing) are
+    rendered, and pages of deleted chats are removed. The manifest is
+    updated in place.
+
+    Each page also gets a precompressed .html.gz copy, unless
+    compress=False.
+
+    output_root/chat must already exist (see
+    generator.prepare_output_dir()).
+
+    Returns the paths of the generated files.
+    """
+    # 1) Fetch all chats with their hashes, in index order
+    chat_rows = fetch_all(
+        """
+        SELECT id, chat_id, hash
+        FROM chats
+        ORDER BY create_time NULLS LAST, id
+        """,
+        dict_rows=False,
+    )
+    logger.info("Found %d chats.", len(chat_rows))
+
+    # 2) Leave pages of unchanged chats alone
+    if manifest is not None:
+        remove_deleted_pages(
+            output_root, manifest, {chat_id for _, chat_id, _ in chat_rows}
+        )
+        chat_rows = [
+            (chat_db_id, chat_id, chat_hash)
+            for chat_db_id, chat_id, chat_hash in chat_rows
+            if manifest.get(chat_id) != chat_hash
+            or not _page_complete(chat_page_path(output_root, chat_id), compress)
+        ]
+
+    logger.info("Rendering %d chats.", len(chat_rows))
+
+    chat_db_ids = [chat_db_id for chat_db_id, _, _ in chat_rows]
+    batches = [
+        chat_db_ids[i:i + RENDER_BATCH_SIZE]
+        for i in range(0, len(chat_db_ids), RENDER_BATCH_SIZE)
+    ]
+
+    # 3) Render the batches
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(
+        workers,
+        MAX_RENDER_CONNECTIONS // WORKER_POOL_CONNECTIONS,
+        len(batches),
+    ))
+
+    render_batch = partial(render_chat_batch, output_root, compress=compress)
+    if workers == 1:
+        results = map(render_batch, batches)
+        paths = [path for paths in results for path in paths]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_pool,
+            initargs=(1, WORKER_POOL_CONNECTIONS),
+        ) as executor:
+            results = executor.map(render_batch, batches)
+            paths = [path for paths in results for path in paths]
+
+    # 4) Record what the pages were rendered from
+    if manifest is not None:
+        manifest.update(
+            (chat_id, chat_hash) for _, chat_id, chat_hash in chat_rows
+        )
+
+    return paths
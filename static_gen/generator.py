@@ -7,80 +7,168 @@ Generate the full static HTML site:
 
 from __future__ import annotations
 
+import os
 import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Optional
 
-from ingest.db import fetch_all
 from ingest.logger import logger
 
 from static_gen.index_renderer import render_index_page
-from static_gen.chat_renderer import render_chat_page
+from static_gen.chat_renderer import render_all_chats
+from static_gen.manifest import load_manifest, save_manifest
+from static_gen.templating import template_fingerprint, warm_template_cache
 
 
 # -----------------------------------------------------------------------------
 # Helper: prepare output directory
 # -----------------------------------------------------------------------------
 
-def prepare_output_dir(root: Path, clean: bool = True) -> None:
+def _remove_trees(paths: List[Path]) -> None:
+    """Delete each directory tree in `paths`."""
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def prepare_output_dir(
+    root: Path,
+    clean: bool = True,
+) -> Optional[threading.Thread]:
     """
     Ensure static_site directory exists and optionally wipe it clean.
+
+    Also creates the chat/ and assets/ subdirectories, so the renderers
+    and copy_assets() can write into them without checking first.
+
+    Wiping moves the old directory into a fresh, uniquely named trash
+    directory next to it (instant) and deletes that on a background
+    thread, so rendering can start right away. That thread is returned,
+    to be joined once the site is generated. Trash left behind by an
+    interrupted earlier run is deleted along with it.
     """
-    if clean and root.exists():
-        logger.info(f"Cleaning existing directory: {root}")
-        shutil.rmtree(root)
+    cleanup = None
 
-    logger.info(f"Creating directory: {root}")
-    root.mkdir(parents=True, exist_ok=True)
+    if clean and root.exists():
+        prefix = f".{root.name}.old-"
+        trash = [p for p in root.parent.glob(prefix + "*") if p.is_dir()]
+        new_trash = Path(tempfile.mkdtemp(dir=root.parent, prefix=prefix))
+        logger.info("Cleaning existing directory: %s", root)
+        root.rename(new_trash / root.name)
+        trash.append(new_trash)
+        cleanup = threading.Thread(
+            target=_remove_trees,
+            args=(trash,),
+            name="clean-output-dir",
+        )
+        cleanup.start()
+
+    logger.info("Creating directory: %s", root)
+    (root / "chat").mkdir(parents=True, exist_ok=True)
+    (root / "assets").mkdir(exist_ok=True)
+
+    return cleanup
 
 
 # -----------------------------------------------------------------------------
 # Helper: copy CSS assets
 # -----------------------------------------------------------------------------
 
+def _copy_file(src: Path, dst: Path) -> None:
+    """
+    Copy one file with os.copy_file_range(), which copies inside the
+    kernel and can share extents (reflink) on filesystems like btrfs or
+    XFS. Falls back to shutil.copyfile() (sendfile-based on Linux) where
+    copy_file_range is unavailable or unsupported.
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            if remaining > 0:
+                raise OSError("source file shrank during copy")
+    except (AttributeError, OSError):
+        shutil.copyfile(src, dst)
+
+
 def copy_assets(output_root: Path) -> None:
     """
-    Copy assets (currently only style.css) into static_site/assets/
+    Copy assets (currently only style.css) into static_site/assets/,
+    which prepare_output_dir() has created.
     """
     assets_src = Path(__file__).resolve().parent / "assets"
     assets_dest = output_root / "assets"
 
-    logger.info(f"Copying assets from {assets_src} → {assets_dest}")
-    shutil.copytree(assets_src, assets_dest, dirs_exist_ok=True)
+    logger.info("Copying assets from %s → %s", assets_src, assets_dest)
+    for src in sorted(assets_src.rglob("*")):
+        dst = assets_dest / src.relative_to(assets_src)
+        # Sorting puts each directory before its contents
+        if src.is_dir():
+            dst.mkdir(exist_ok=True)
+        else:
+            _copy_file(src, dst)
 
 
 # -----------------------------------------------------------------------------
 # Main generate function
 # -----------------------------------------------------------------------------
 
-def generate_static_site(output_root: Path = Path("static_site")) -> None:
+def generate_static_site(
+    output_root: Path = Path("static_site"),
+    workers: Optional[int] = None,
+    clean: bool = False,
+    compress: bool = True,
+) -> None:
     """
     Generate the entire static HTML archive.
+
+    The build is incremental: chat pages are only re-rendered when the
+    chat changed since the previous build (see static_gen.manifest).
+    clean=True wipes output_root first and renders everything.
+
+    Every page is also written gzip-compressed (<page>.html.gz), for
+    servers that serve precompressed files; compress=False skips that.
+
+    `workers` sets the number of processes used to render chat pages
+    (default: one per CPU).
     """
     logger.info("Starting static site generation...")
 
     # 1) Prepare output directory
-    prepare_output_dir(output_root, clean=True)
-
-    # 2) Copy assets
-    copy_assets(output_root)
-
-    # 3) Fetch all chats
-    chats = fetch_all(
-        """
-        SELECT id, chat_id, title
-        FROM chats
-        ORDER BY create_time NULLS LAST, id
-        """
-    )
-    logger.info(f"Found {len(chats)} chats to render.")
+    cleanup = prepare_output_dir(output_root, clean=clean)
+
+    # 2) Compile templates up front: render workers then load them from
+    #    the bytecode cache, and threads below never race to compile
+    warm_template_cache()
+
+    # 3) Assets and the index don't depend on the chat pages; copy and
+    #    render them on background threads while the chat pages render
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="site") as background:
+        assets_done = background.submit(copy_assets, output_root)
+        index_done = background.submit(render_index_page, output_root, compress)
+
+        # 4) Render new and changed chat pages (in parallel worker processes)
+        fingerprint = template_fingerprint()
+        manifest = load_manifest(output_root, fingerprint)
+        render_all_chats(
+            output_root, workers=workers, manifest=manifest, compress=compress
+        )
+
+        assets_done.result()
+        index_done.result()
 
-    # 4) Render individual chat pages
-    for chat in chats:
-        chat_id = chat["id"]
-        render_chat_page(output_root, chat_id)
+    # 5) Remember what was rendered, for the next incremental build
+    save_manifest(output_root, manifest, fingerprint)
 
-    # 5) Render index page
-    render_index_page(output_root)
+    # 6) Wait for the previous site to be deleted
+    if cleanup is not None:
+        cleanup.join()
 
     logger.info("Static site generation complete.")
 
@@ -90,4 +178,29 @@ def generate_static_site(output_root: Path = Path("static_site")) -> None:
 # -----------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    generate_static_site()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate the static HTML archive.")
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="Delete the existing site and render every page from scratch."
+    )
+    parser.add_argument(
+        "--no-gzip",
+        action="store_true",
+        help="Don't write precompressed .html.gz copies of the pages."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to render chat pages (default: CPU count)."
+    )
+
+    args = parser.parse_args()
+    generate_static_site(
+        workers=args.workers,
+        clean=args.clean,
+        compress=not args.no_gzip,
+    )
@@ -4,83 +4,126 @@ Render the main index.html listing all chats.
 
 from __future__ import annotations
 
+import gzip
 import os
+from contextlib import ExitStack
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Iterable, Iterator, List, Tuple
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
 
-from ingest.db import fetch_all
+from ingest.db import fetch_iter
 from ingest.logger import logger
 
+from static_gen.page_writer import GZIP_LEVEL, atomic_open, gzip_sibling
+from static_gen.templating import get_template
+
 
 # -----------------------------------------------------------------------------
-# Jinja2 environment
+# Core function
 # -----------------------------------------------------------------------------
 
-TEMPLATES_DIR = Path(__file__).resolve().parent / "templates"
+# Template output events joined per chunk, and the file write buffer; the
+# index is written in ~1 MiB syscalls, and never held in memory in full.
+STREAM_BUFFER_EVENTS = 64
+WRITE_BUFFER_SIZE = 1024 * 1024
 
+# Index rows rendered per chunk handed to the template.
+ROWS_PER_CHUNK = 500
 
-def get_env() -> Environment:
-    env = Environment(
-        loader=FileSystemLoader(str(TEMPLATES_DIR)),
-        autoescape=select_autoescape(["html", "xml"]),
-    )
-    return env
 
+def _chat_list_chunks(
+    chats: Iterable[Tuple[str, str, Any]],
+) -> Iterator[Markup]:
+    """
+    Render the index's <li> rows in Python, ROWS_PER_CHUNK at a time.
 
-# -----------------------------------------------------------------------------
-# Helpers
-# -----------------------------------------------------------------------------
-
-def ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
+    The list is the only part of the index that grows with the archive,
+    and each row is trivial; plain string formatting is several times
+    faster than a Jinja loop, which dispatches every {{ }} separately.
+    Values are escaped exactly as the template would.
+    """
+    chunk: List[str] = []
+    for chat_id, title, create_time in chats:
+        date = (
+            f'        <span class="date">{escape(create_time)}</span>\n'
+            if create_time
+            else ""
+        )
+        chunk.append(
+            "    <li>\n"
+            f'        <a href="chat/{escape(chat_id)}.html">{escape(title)}</a>\n'
+            f"{date}"
+            "    </li>\n"
+        )
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield Markup("".join(chunk))
+            chunk = []
 
+    if chunk:
+        yield Markup("".join(chunk))
 
-# -----------------------------------------------------------------------------
-# Core function
-# -----------------------------------------------------------------------------
 
-def render_index_page(output_root: Path) -> Path:
+def render_index_page(output_root: Path, compress: bool = True) -> Path:
     """
-    Generate static_site/index.html by listing all chats in the database.
+    Generate static_site/index.html by listing all chats in the database,
+    plus a precompressed index.html.gz unless compress=False.
+
+    output_root must already exist (see generator.prepare_output_dir()).
     """
 
-    # 1) Fetch all chats from DB
-    rows = fetch_all(
+    # 1) Stream chats from the DB; rows are rendered as they are
+    #    fetched, without an intermediate list. They are plain
+    #    (chat_id, title, create_time) tuples.
+    chats = fetch_iter(
         """
-        SELECT id, chat_id, title, create_time
+        SELECT chat_id, title, create_time
         FROM chats
         ORDER BY create_time NULLS LAST, id
-        """
+        """,
+        dict_rows=False,
     )
 
-    chats: List[Dict[str, Any]] = []
-    for r in rows:
-        chats.append(
-            {
-                "id": r["id"],
-                "chat_id": r["chat_id"],
-                "title": r["title"],
-                "create_time": r["create_time"],
-            }
-        )
+    # 2) Render index using Jinja, streaming it straight to
+    #    static_site/index.html (the page is never held as one string)
+    template = get_template("index.html")
 
-    # 2) Render index using Jinja
-    env = get_env()
-    template = env.get_template("index.html")
+    out_path = output_root / "index.html"
 
-    html = template.render(
+    stream = template.stream(
         title="Chat Archive",
-        chats=chats,
+        chat_list_chunks=_chat_list_chunks(chats),
         css_prefix="",  # index is at static_site/index.html, same folder as assets/
     )
-
-    # 3) Write to static_site/index.html
-    ensure_dir(output_root)
-    out_path = output_root / "index.html"
-    out_path.write_text(html, encoding="utf-8")
-
-    logger.info(f"Rendered index → {out_path}")
+    # Join template events into larger chunks before encoding them
+    stream.enable_buffering(STREAM_BUFFER_EVENTS)
+
+    # 3) Write the page and, in the same pass, its gzip copy
+    gz_path = gzip_sibling(out_path)
+
+    # (each file appears atomically once complete, see atomic_open())
+    with ExitStack() as stack:
+        f = stack.enter_context(atomic_open(out_path, buffering=WRITE_BUFFER_SIZE))
+        gz = None
+        if compress:
+            gz = stack.enter_context(
+                gzip.GzipFile(
+                    fileobj=stack.enter_context(atomic_open(gz_path)),
+                    mode="wb",
+                    compresslevel=GZIP_LEVEL,
+                    mtime=0,
+                )
+            )
+
+        for chunk in stream:
+            data = chunk.encode("utf-8")
+            f.write(data)
+            if gz is not None:
+                gz.write(data)
+
+    if not compress:
+        gz_path.unlink(missing_ok=True)
+
+    logger.info("Rendered index → %s", out_path)
 
     return out_path
@@ -0,0 +1,56 @@
+"""
+Build manifest for incremental static site generation.
+
+Regenerating the site normally re-renders every chat page, even though
+most chats have not changed since the last build. The manifest records,
+per chat, the database hash (chats.hash) the page was rendered from:
+
+    {chat_id: chat_hash, ...}
+
+A chat whose hash still matches keeps its existing page. The manifest
+also stores a fingerprint of the templates, so editing a template
+re-renders everything.
+
+It lives next to the pages (static_site/.manifest.json). A build without
+a usable manifest renders every chat page and writes a new one.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict
+
+from ingest.json_cache import load_json_cache, save_json_cache
+
+MANIFEST_NAME = ".manifest.json"
+
+# Bump when page layout changes in a way templates don't capture
+# (e.g. rendering code or template compile options), so old manifests
+# are ignored.
+MANIFEST_VERSION = 3
+
+Manifest = Dict[str, str]
+
+
+def _manifest_header(fingerprint: str) -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, "templates": fingerprint}
+
+
+def load_manifest(output_root: Path, fingerprint: str) -> Manifest:
+    """
+    Load the manifest of a previous build in output_root. A missing,
+    unreadable or outdated manifest (including one written for other
+    templates) yields an empty one.
+    """
+    return load_json_cache(
+        output_root / MANIFEST_NAME, _manifest_header(fingerprint), "build manifest"
+    )
+
+
+def save_manifest(output_root: Path, manifest: Manifest, fingerprint: str) -> None:
+    """
+    Write the manifest to output_root, replacing the old file atomically.
+    """
+    save_json_cache(
+        output_root / MANIFEST_NAME, _manifest_header(fingerprint), manifest
+    )
@@ -0,0 +1,241 @@
+"""
+Background writer for generated pages.
+
+Rendering is CPU-bound and holds the GIL; writing a page is a sequence of
+blocking open/write/close syscalls that release it. PageWriter moves the
+writes onto a dedicated thread so that disk I/O for one page overlaps with
+rendering of the next ones. Pages are gzip-compressed on that thread too
+(zlib releases the GIL as well).
+"""
+
+from __future__ import annotations
+
+import gzip
+import mmap
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+
+# Pages queued for writing before write() blocks; bounds memory use when
+# the disk is slower than rendering.
+MAX_PENDING_PAGES = 128
+
+# Pages are also stored precompressed (foo.html.gz next to foo.html), for
+# static servers that can send those directly (e.g. nginx gzip_static).
+# Compression happens once at build time, so use the best ratio.
+GZIP_LEVEL = 9
+
+# Pages larger than this are written by preallocating the whole file and
+# copying the data in through mmap, PREALLOCATE_CHUNK bytes at a time.
+# One fallocate() lets the filesystem pick contiguous extents up front
+# instead of growing the file write by write; small pages gain nothing.
+PREALLOCATE_THRESHOLD = 1 << 20
+PREALLOCATE_CHUNK = 1 << 20
+
+
+# Linux can create a file without a name (O_TMPFILE) and link it into the
+# directory once it is complete; the link goes through /proc/self/fd.
+_HAVE_O_TMPFILE = hasattr(os, "O_TMPFILE") and os.path.isdir("/proc/self/fd")
+
+
+def _temp_name(path: Path) -> Path:
+    """A hidden name next to `path`, unique per process and thread."""
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _open_tmpfile(directory: Path) -> Optional[Tuple[int, int]]:
+    """
+    Open an unnamed file in `directory`; return (directory fd, file fd),
+    or None if unsupported.
+    """
+    if not _HAVE_O_TMPFILE:
+        return None
+
+    dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        return dir_fd, os.open(".", os.O_RDWR | os.O_TMPFILE, 0o644, dir_fd=dir_fd)
+    except OSError:
+        os.close(dir_fd)
+        return None  # e.g. a filesystem without O_TMPFILE support
+
+
+@contextmanager
+def atomic_open(path: Path, buffering: int = -1) -> Iterator[BinaryIO]:
+    """
+    Open `path` for binary writing such that it only appears, complete,
+    once the block exits without error; readers (and a process crash)
+    never see a half-written file, and a failed write leaves the old file
+    in place. Nothing is fsync'd, so after a power loss or system crash
+    the file may still be empty or partial.
+
+    On Linux the data goes to an O_TMPFILE inode that is linked into
+    place at the end (through a temporary name and os.replace() if the
+    file already exists). Elsewhere a temporary file is written and
+    renamed over `path`. The file is opened read-write, so that it can
+    also be mmap'd.
+    """
+    fds = _open_tmpfile(path.parent)
+
+    if fds is not None:
+        dir_fd, fd = fds
+        try:
+            with os.fdopen(fd, "wb", buffering=buffering) as f:
+                yield f
+                f.flush()
+                # Passing dst_dir_fd makes os.link() use linkat() with
+                # AT_SYMLINK_FOLLOW, which links the inode behind the
+                # /proc entry rather than the entry itself.
+                proc_path = f"/proc/self/fd/{fd}"
+                try:
+                    os.link(proc_path, path.name, dst_dir_fd=dir_fd)
+                except FileExistsError:
+                    tmp_name = _temp_name(path).name
+                    os.link(proc_path, tmp_name, dst_dir_fd=dir_fd)
+                    os.replace(
+                        tmp_name, path.name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd
+                    )
+        finally:
+            os.close(dir_fd)
+        return
+
+    tmp_path = _temp_name(path)
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        with os.fdopen(fd, "wb", buffering=buffering) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def gzip_sibling(path: Path) -> Path:
+    """Return the path of a page's precompressed copy: <path>.gz"""
+    return path.with_name(path.name + ".gz")
+
+
+def _write_data(f: BinaryIO, data: bytes) -> None:
+    """
+    Write `data` to the freshly opened file `f`. Large payloads go through
+    posix_fallocate() and mmap (see PREALLOCATE_THRESHOLD); if either is
+    unavailable there, a plain write() is used.
+    """
+    size = len(data)
+    if size <= PREALLOCATE_THRESHOLD or not hasattr(os, "posix_fallocate"):
+        f.write(data)
+        return
+
+    f.flush()
+    fd = f.fileno()
+    try:
+        os.posix_fallocate(fd, 0, size)
+        with mmap.mmap(fd, size) as mm:
+            view = memoryview(data)
+            for start in range(0, size, PREALLOCATE_CHUNK):
+                end = min(start + PREALLOCATE_CHUNK, size)
+                mm[start:end] = view[start:end]
+    except OSError:
+        # e.g. a filesystem without fallocate support; the file may have
+        # been extended already, so overwrite it from the start.
+        f.seek(0)
+        f.write(data)
+        f.truncate()
+
+
+def write_page(path: Path, data: Union[str, bytes], compress: bool = True) -> None:
+    """
+    Write a page (text is encoded as UTF-8), plus its gzip sibling if
+    `compress`. Without it, a sibling left by an earlier build is removed
+    so it can't go stale.
+
+    Both files are replaced atomically (see atomic_open()). The .gz has a
+    zero mtime, so identical pages compress to identical bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with atomic_open(path) as f:
+        _write_data(f, data)
+
+    gz_path = gzip_sibling(path)
+    if compress:
+        with atomic_open(gz_path) as f:
+            _write_data(f, gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+    else:
+        gz_path.unlink(missing_ok=True)
+
+
+class PageWriter:
+    """
+    Write files on a background thread, in submission order.
+
+        with PageWriter() as writer:
+            for ...:
+                writer.write(path, html)
+
+    Leaving the block waits until every queued page is on disk. The first
+    error raised by a write is re-raised from write() or on exit; pages
+    queued after it are dropped.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = MAX_PENDING_PAGES,
+        compress: bool = True,
+    ) -> None:
+        self._compress = compress
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(
+            target=self._run, name="page-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, path: Path, data: Union[str, bytes]) -> None:
+        """Queue a page to be written with write_page()."""
+        self._raise_error()
+        self._queue.put((path, data))
+
+    def close(self) -> None:
+        """Wait for all queued pages to be written."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self) -> "PageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+            return
+
+        # Don't mask the caller's exception with a write error
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # ------------------------------------------------------------------
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so write() never blocks forever
+
+            path, data = item
+            try:
+                write_page(path, data, self._compress)
+            except BaseException as e:
+                self._error = e
@@ -0,0 +1,101 @@
+"""
+Shared Jinja2 environment for the static site renderers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+import jinja2
+
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+)
+
+from ingest.config import config
+
+
+TEMPLATES_DIR = Path(__file__).resolve().parent / "templates"
+
+# Environment options that change the code templates compile to. The
+# bytecode cache only keys entries on the template source, so these
+# (with the Jinja version) pick the cache subdirectory instead.
+_COMPILE_OPTIONS = {
+    "autoescape": True,  # every template is HTML
+    "trim_blocks": True,
+    "lstrip_blocks": True,
+}
+
+
+def _bytecode_cache_dir() -> Path:
+    """
+    Return the bytecode cache directory for this Jinja version and
+    _COMPILE_OPTIONS, creating it if needed.
+    """
+    options = (jinja2.__version__, sorted(_COMPILE_OPTIONS.items()))
+    key = hashlib.sha256(repr(options).encode("utf-8")).hexdigest()[:16]
+    path = config.TEMPLATE_CACHE_DIR / key
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@lru_cache(maxsize=None)
+def get_env() -> Environment:
+    """
+    Return the Jinja2 environment, created on first use.
+
+    Templates are compiled once and kept; auto_reload is off because the
+    templates do not change during a generation run. Whitespace around
+    block tags is stripped when templates are compiled (trim_blocks,
+    lstrip_blocks), which keeps the pages and the compiled code smaller.
+
+    Compiled templates are also stored on disk (config.TEMPLATE_CACHE_DIR),
+    so later runs and every render worker process load bytecode instead of
+    parsing the template sources. Entries are keyed by a checksum of the
+    source, so edited templates are recompiled; Environment options are
+    not part of that key, so each combination of _COMPILE_OPTIONS and
+    Jinja version gets a cache directory of its own.
+    """
+    env = Environment(
+        loader=FileSystemLoader(str(TEMPLATES_DIR)),
+        auto_reload=False,
+        cache_size=-1,  # never evict a compiled template
+        bytecode_cache=FileSystemBytecodeCache(str(_bytecode_cache_dir())),
+        **_COMPILE_OPTIONS,
+    )
+    return env
+
+
+@lru_cache(maxsize=None)
+def get_template(name: str) -> Template:
+    """Return the compiled template `name` (e.g. "chat.html")."""
+    return get_env().get_template(name)
+
+
+def warm_template_cache() -> None:
+    """
+    Compile every template now, filling the on-disk bytecode cache before
+    render workers start (they then never parse a template).
+    """
+    for name in get_env().list_templates():
+        get_template(name)
+
+
+def template_fingerprint() -> str:
+    """
+    Return a hash of every template file, to tell whether pages rendered
+    by an earlier run are still current.
+    """
+    h = hashlib.sha256()
+    for path in sorted(TEMPLATES_DIR.rglob("*")):
+        if path.is_file():
+            h.update(str(path.relative_to(TEMPLATES_DIR)).encode("utf-8"))
+            h.update(b"\0")
+            h.update(path.read_bytes())
+            h.update(b"\0")
+    return h.hexdigest()
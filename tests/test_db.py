@@ -0,0 +1,60 @@
+"""
+Database tests. They need a PostgreSQL database with schema.sql applied,
+given as CHAT_ARCHIVE_TEST_DB_URL; without it they are skipped.
+"""
+
+import os
+import uuid
+
+import pytest
+
+TEST_DB_URL = os.environ.get("CHAT_ARCHIVE_TEST_DB_URL")
+if not TEST_DB_URL:
+    pytest.skip("CHAT_ARCHIVE_TEST_DB_URL is not set", allow_module_level=True)
+
+os.environ["CHAT_ARCHIVE_DB_URL"] = TEST_DB_URL
+
+import psycopg2  # noqa: E402
+
+from ingest import db  # noqa: E402
+from ingest.run_ingest import upsert_chat  # noqa: E402
+
+
+@pytest.fixture
+def single_connection_pool(monkeypatch):
+    """A fresh pool of one connection, so every call reuses it."""
+    monkeypatch.setattr(db, "_pool", None)
+    monkeypatch.setattr(db, "_pool_size", (1, 1))
+    yield
+    if db._pool is not None:
+        db._pool.closeall()
+
+
+def _normalized_chat(chat_id: str) -> dict:
+    return {
+        "chat_id": chat_id,
+        "title": "Prepared statement test",
+        "create_time": None,
+        "update_time": None,
+        "model": None,
+        "messages": [],
+        "raw_json": {"id": chat_id},
+    }
+
+
+def test_upsert_after_failed_transaction(single_connection_pool):
+    chat_id = f"test-{uuid.uuid4()}"
+    normalized = _normalized_chat(chat_id)
+    try:
+        _, status = upsert_chat(normalized, "hash-1")
+        assert status == "new"
+
+        # Resets the connection, which drops its prepared statements
+        with pytest.raises(psycopg2.errors.DivisionByZero):
+            with db.transaction() as cur:
+                cur.execute("SELECT 1 / 0")
+
+        _, status = upsert_chat(normalized, "hash-2")
+        assert status == "updated"
+    finally:
+        db.execute("DELETE FROM chats WHERE chat_id = %s", (chat_id,))